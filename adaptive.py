@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+import random
+import time
+
+from utils import EPICS_TOUT, CMD_TOUT
+
+logger = logging.getLogger()
+
+# RFC 6298 minimum, a slow serial transaction must not count as a timeout
+MIN_TOUT, MAX_TOUT = EPICS_TOUT, 10.0
+MIN_PAUSE, MAX_PAUSE = 0.05, 2.0
+BACKOFF_BASE, BACKOFF_MAX = 0.1, 5.0
+RETRIES = 3
+
+UNKNOWN_HOST = "unknown"
+
+
+class HostLatency(object):
+    """ Smoothed put latency of a host and its variation, estimated as the TCP
+    retransmission timeout (RFC 6298) """
+
+    ALPHA, BETA, K = 1 / 8, 1 / 4, 4
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+        # Used until the first latency sample
+        self.rto = EPICS_TOUT
+
+    def update(self, sample):
+        if self.srtt is None:
+            self.srtt, self.rttvar = sample, sample / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(
+                self.srtt - sample
+            )
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * sample
+        self.rto = min(max(self.srtt + self.K * self.rttvar, MIN_TOUT), MAX_TOUT)
+
+    def expire(self):
+        """ A put timed out, back the timeout off until the next sample """
+        self.rto = min(self.rto * 2, MAX_TOUT)
+
+    def timeout(self):
+        return self.rto
+
+    def pause(self):
+        """ Pause between consecutive commands to the host """
+        if self.srtt is None:
+            return CMD_TOUT
+        return min(max(2 * self.srtt + self.rttvar, MIN_PAUSE), MAX_PAUSE)
+
+
+class AdaptiveWriter(object):
+    """ CA puts with per host timeouts and pacing, failed puts are retried with
+    jittered exponential backoff """
+
+    def __init__(self, retries=RETRIES):
+        self.retries = retries
+        self.hosts = {}
+
+    def latency(self, host):
+        host = host or UNKNOWN_HOST
+        if host not in self.hosts:
+            self.hosts[host] = HostLatency()
+        return self.hosts[host]
+
+    def pause(self, host):
+        return self.latency(host).pause()
+
+    def backoff(self, attempt):
+        """ Full jitter: uniform between zero and the exponential bound """
+        return random.uniform(0, min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX))
+
+    def start(self, pv, value):
+        """ Issue the put, returns (latency estimate, timeout) or None if not connected """
+        if not pv.connected:
+            return None
+        latency = self.latency(pv.host)
+        pv.put(value, wait=False, use_complete=True)
+        return latency, latency.timeout()
+
+    def finish(self, pv, value, attempt, latency, elapsed):
+        """ Account for a put that completed (True) or timed out (False) """
+        if pv.put_complete:
+            # Karn: a late completion of an earlier attempt would be a false sample
+            if attempt == 0:
+                latency.update(elapsed)
+            return True
+
+        latency.expire()
+        logger.warning(
+            "put {} {} timed out after {:.3f} s (attempt {} of {})".format(
+                pv.pvname, value, elapsed, attempt + 1, self.retries + 1
+            )
+        )
+        return False
+
+    async def put(self, pv, value):
+        for attempt in range(self.retries + 1):
+            if not pv.connected:
+                deadline = time.time() + EPICS_TOUT
+                while not pv.connected and time.time() < deadline:
+                    await asyncio.sleep(0.005)
+
+            started = self.start(pv, value)
+            if started is None:
+                logger.warning("PV {} not connected".format(pv.pvname))
+            else:
+                latency, timeout = started
+                t_ini = time.time()
+                while not pv.put_complete and time.time() - t_ini < timeout:
+                    await asyncio.sleep(0.005)
+                if self.finish(pv, value, attempt, latency, time.time() - t_ini):
+                    return True
+
+            if attempt < self.retries:
+                await asyncio.sleep(self.backoff(attempt))
+        logger.error("put {} {} failed".format(pv.pvname, value))
+        return False
@@ -5,16 +5,31 @@ import logging
 import math
 import asyncio
 import sys
+import time
 
 from datetime import timedelta, datetime
-from utils import getAgilent, getDevices, getChannels, TIMEFMT
+from utils import (
+    getAgilent,
+    getDevices,
+    getChannels,
+    nextCronTime,
+    TIMEFMT,
+    EPICS_TOUT,
+    CMD_TOUT,
+)
+from interlock import Watchdog, getInterlockPVs
+from tracing import Tracer, JOB
+from adaptive import AdaptiveWriter
 
 from qtpy.QtCore import QObject, Signal, QRunnable
 
 logger = logging.getLogger()
 
-EPICS_TOUT = 1
-CMD_TOUT = 0.500
+# Pump current above which the interlock trips [A]
+CURRENT_MAX = 1e-4
+# Busy wait over the last SPIN_TOUT seconds before a scheduled write is fired,
+# sleeps are only ms accurate. The loop still runs the interlock callbacks meanwhile
+SPIN_TOUT = 0.010
 
 FIXED, STEP, STEP_TO_FIXED = "fixed", "step", "step_to_fixed"
 
@@ -26,34 +41,125 @@ class AgilentAsync(QObject):
 
     def __init__(self, *args, **kwargs):
         super(AgilentAsync, self).__init__(*args, **kwargs)
+        self.pvs = {}
+        # Commands are only logged unless writing is enabled
+        self.write = False
+        # Per host timeouts, pacing and retries of the writes
+        self.writer = AdaptiveWriter()
+        self.hosts = {}
+
+        # Interlock, disabled while interlockFactor is None
+        self.interlockFactor = None
+        self.currentMax = CURRENT_MAX
+        self.rollback = False
+        self.interlock = None
+        self.tripped = None
+        # Journal of (dev, pv, previous value) used by the rollback
+        self.applied = []
+        # Setpoints monitored for the journal when rolling back
+        self.values = {}
+
+        self.traceFile = None
+        self.tracer = Tracer(enabled=False)
+
+    def setWrite(self, write):
+        """ Enable the CA writes of every mode, immediate or scheduled """
+        self.write = write
+
+    def setInterlock(self, factor, rollback=False, current_max=CURRENT_MAX):
+        """ Abort the job when a sector pressure rises factor times or a pump current
+        exceeds current_max """
+        self.interlockFactor = factor
+        self.currentMax = current_max
+        self.rollback = rollback
+
+    def setTrace(self, filename):
+        """ Write a Chrome trace of each job to filename, strftime placeholders are
+        replaced by the job start time """
+        self.traceFile = filename
+
+    def newPV(self, pvname):
+        """ With rollback the setpoints are monitored, so the journal never waits on a get """
+        if self.rollback:
+            return epics.PV(pvname, callback=self.onValue)
+        return epics.PV(pvname, auto_monitor=False)
+
+    def onValue(self, pvname=None, value=None, **kw):
+        """ CA callback, runs in the CA thread """
+        self.values[pvname] = value
+
+    async def previous(self, pvnames):
+        """ Current values of the monitored pvnames, None for the ones not received """
+        deadline = time.time() + EPICS_TOUT
+        while (
+            not all([pvname in self.values for pvname in pvnames])
+            and time.time() < deadline
+        ):
+            await asyncio.sleep(0.005)
+        return dict([(pvname, self.values.get(pvname)) for pvname in pvnames])
+
+    def getPV(self, pvname):
+        if pvname not in self.pvs:
+            self.pvs[pvname] = self.newPV(pvname)
+        return self.pvs[pvname]
+
+    async def put(self, dev, pvname, val, journal=True):
+        """ caput without blocking the event loop, so the interlock can act meanwhile """
+        logger.info("set {} {}".format(pvname, val))
+        if not self.write:
+            return True
+        pv = self.getPV(pvname)
+
+        deadline = time.time() + EPICS_TOUT
+        if not pv.connected:
+            with self.tracer.span("connect", "connect", dev, pv=pvname):
+                while not pv.connected and time.time() < deadline:
+                    await asyncio.sleep(0.005)
+        if not pv.connected:
+            logger.warning("PV {} not connected".format(pvname))
+            return False
+        self.hosts[dev] = pv.host
+        self.tracer.setHost(dev, pv.host)
+
+        if self.rollback and journal:
+            with self.tracer.span("get", "get", dev, pv=pvname):
+                previous = await self.previous([pvname])
+                self.applied.append((dev, pvname, previous[pvname]))
+
+        with self.tracer.span("put", "put", dev, pv=pvname, value=val):
+            return await self.writer.put(pv, val)
+
+    def pause(self, dev):
+        """ Pause between commands to the device, adapted to its host latency """
+        return self.writer.pause(self.hosts.get(dev))
+
+    async def wait(self, dev, seconds, name="wait", idle=False):
+        with self.tracer.span(name, "wait", dev, idle=idle, seconds=seconds):
+            await asyncio.sleep(seconds)
 
     async def toFixed(
         self, dev, chs, voltage,
     ):
-        self.timerStatus.emit({"dev": dev, "status": "to Fixed"})
+        with self.tracer.span("toFixed", "device", dev, voltage=voltage):
+            self.timerStatus.emit({"dev": dev, "status": "to Fixed"})
 
-        pv, val = dev + ":Step-SP_Backend", 0
-        logger.info("set {} {}".format(pv, val))
-        # epics.caput(pv, val, timeout=EPICS_TOUT)
-        await asyncio.sleep(CMD_TOUT)
+            await self.put(dev, dev + ":Step-SP_Backend", 0)
+            await self.wait(dev, self.pause(dev))
 
-        for ch in chs:
-            pv, val = ch + ":VoltageTarget-SP", voltage
-            logger.info("set {} {}".format(pv, val))
-            # epics.caput(pv, val, timeout=EPICS_TOUT)
-            await asyncio.sleep(CMD_TOUT)
-        self.timerStatus.emit({"dev": dev, "status": "Done"})
+            for ch in chs:
+                await self.put(dev, ch + ":VoltageTarget-SP", voltage)
+                await self.wait(dev, self.pause(dev))
+            self.timerStatus.emit({"dev": dev, "status": "Done"})
 
     async def toStep(
         self, dev, chs,
     ):
-        self.timerStatus.emit({"dev": dev, "status": "to Step"})
+        with self.tracer.span("toStep", "device", dev):
+            self.timerStatus.emit({"dev": dev, "status": "to Step"})
 
-        pv, val = dev + ":Step-SP_Backend", 15
-        logger.info("set {} {}".format(pv, val))
-        # epics.caput(pv, val, timeout=EPICS_TOUT)
-        self.timerStatus.emit({"dev": dev, "status": "Done"})
-        await asyncio.sleep(CMD_TOUT)
+            await self.put(dev, dev + ":Step-SP_Backend", 15)
+            self.timerStatus.emit({"dev": dev, "status": "Done"})
+            await self.wait(dev, self.pause(dev))
 
     async def toStepToFix(self, _delay, dev, chs, voltage):
         """ Run a function then another ..."""
@@ -75,7 +181,7 @@ class AgilentAsync(QObject):
             remaining = delay - t_elapsed
             logger.info("Time remaining {} for device {}.".format(remaining, dev))
             self.timerStatus.emit({"dev": dev, "status": remaining})
-            await asyncio.sleep(tick)
+            await self.wait(dev, tick, "delay", idle=True)
 
             t_now = datetime.now()
             t_elapsed = t_now - t_ini
@@ -88,8 +194,328 @@ class AgilentAsync(QObject):
 
         await self.toFixed(dev, chs, voltage)
 
-    async def handle(self, mode, step_to_fixed_delay, voltage, devices):
+    def stage(self, mode, step_to_fixed_delay, voltage, devices):
+        """ List of rounds (offset in seconds, [(dev, pv, value), ...]).
+        Every round writes the same command to all devices at once, consecutive
+        commands to the same device are spaced by CMD_TOUT as in toFixed. """
+        step, fixed = [], []
+        for device in devices:
+            dev = device["prefix"]
+            chs = [ch["prefix"] for ch_name, ch in device["channels"].items()]
+
+            step.append([(dev, dev + ":Step-SP_Backend", 15)])
+            fixed.append(
+                [(dev, dev + ":Step-SP_Backend", 0)]
+                + [(dev, ch + ":VoltageTarget-SP", voltage) for ch in chs]
+            )
+
+        def toRounds(commands, offset):
+            length = max([len(cmds) for cmds in commands], default=0)
+            return [
+                (
+                    offset + idx * CMD_TOUT,
+                    [cmds[idx] for cmds in commands if idx < len(cmds)],
+                )
+                for idx in range(length)
+            ]
+
+        if mode == FIXED:
+            return toRounds(fixed, 0)
+        elif mode == STEP:
+            return toRounds(step, 0)
+        elif mode == STEP_TO_FIXED:
+            return toRounds(step, 0) + toRounds(fixed, step_to_fixed_delay)
+        raise ValueError("Invalid mode {}".format(mode))
+
+    async def connect(self, pvnames):
+        """ Create and connect all PVs at once, returns {pvname: epics.PV} of the connected ones.
+        The connection waits block, they run in a worker thread """
+        with self.tracer.span("connect", "connect", pvs=len(pvnames)):
+            return await asyncio.get_event_loop().run_in_executor(
+                None, self._connect, pvnames
+            )
+
+    def _connect(self, pvnames):
+        pvs = {pvname: self.newPV(pvname) for pvname in pvnames}
+        deadline = time.time() + EPICS_TOUT
+
+        connected = {}
+        for pvname, pv in pvs.items():
+            if pv.wait_for_connection(timeout=max(deadline - time.time(), 0.001)):
+                connected[pvname] = pv
+            else:
+                logger.warning("PV {} not connected".format(pvname))
+        return connected
+
+    async def waitUntil(self, target):
+        """ Sleep until the wall-clock timestamp target, busy waiting over the last SPIN_TOUT seconds """
+        remaining = target - time.time()
+        while remaining > SPIN_TOUT:
+            # Short naps so wall clock adjustments are followed
+            await asyncio.sleep(min(remaining - SPIN_TOUT, 60))
+            remaining = target - time.time()
+
+        while time.time() < target:
+            # Yield on every turn so the callbacks ready meanwhile are not delayed
+            await asyncio.sleep(0)
+
+    async def fire(self, target, writes, pvs, t_next, previous):
+        """ Put all writes at target and wait for the completion of each one, at most
+        until t_next (the next round target) so the round spacing always holds.
+        Returns {dev: (issue offset, completion offset)} in seconds relative to target,
+        the completion offset is inf when a put did not complete in time.
+        previous holds the values journaled for the rollback. Without write the
+        commands are only logged. """
+        completed = {}
+        late = []
+
+        def onComplete(pvname=None, data=None, **kw):
+            if late:
+                logger.warning(
+                    "put {} completed late, +{:.3f} ms".format(
+                        pvname, (time.time() - target) * 1e3
+                    )
+                )
+            completed[data] = time.time()
+
+        with self.tracer.span("waitUntil", "wait", idle=True, target=target):
+            await self.waitUntil(target)
+
+        if not self.write:
+            for dev, pvname, value in writes:
+                logger.info("set {} {}".format(pvname, value))
+            return {}
+
+        issued = []
+        for idx, (dev, pvname, value) in enumerate(writes):
+            pv = pvs.get(pvname)
+            if pv is None:
+                continue
+            issued.append((idx, dev, time.time()))
+            pv.put(value, wait=False, callback=onComplete, callback_data=idx)
+            if self.rollback:
+                self.applied.append((dev, pvname, previous.get(pvname)))
+        epics.ca.flush_io()
+
+        deadline = min(time.time() + EPICS_TOUT, t_next)
+        while len(completed) < len(issued) and time.time() < deadline:
+            await asyncio.sleep(0.001)
+        # Completions from now on are logged as late by onComplete
+        late.append(True)
+
+        skews = {}
+        for idx, dev, t_issue in issued:
+            _, pvname, value = writes[idx]
+            if idx not in completed:
+                logger.warning("put {} not completed".format(pvname))
+            t_done = completed.get(idx, math.inf)
+
+            self.tracer.setHost(dev, pvs[pvname].host)
+            self.tracer.add(
+                "put",
+                "put",
+                dev,
+                t_issue,
+                min(t_done, deadline),
+                pv=pvname,
+                value=value,
+                completed=idx in completed,
+            )
+
+            _issue, _done = skews.get(dev, (-math.inf, -math.inf))
+            skews[dev] = (
+                max(_issue, t_issue - target),
+                max(_done, t_done - target),
+            )
+        return skews
+
+    async def scheduled(self, when, mode, step_to_fixed_delay, voltage, devices):
+        """ Pre-connect and stage every write then fire them at the datetime when """
+        rounds = self.stage(mode, step_to_fixed_delay, voltage, devices)
+        pvs = await self.connect(
+            set([pvname for _, writes in rounds for _, pvname, _ in writes])
+        )
+
+        t_ini = when.timestamp()
+        logger.info(
+            "{} PVs connected, {} rounds scheduled at {}".format(
+                len(pvs), len(rounds), when.strftime(TIMEFMT)
+            )
+        )
+        for dev in set([dev for _, writes in rounds for dev, _, _ in writes]):
+            self.timerStatus.emit(
+                {"dev": dev, "status": "Scheduled {}".format(when.strftime(TIMEFMT))}
+            )
+
+        # Wait for the monitored values now, they are snapshot without waiting
+        # before the first round
+        if self.rollback:
+            await self.previous(list(pvs))
+
+        if self.interlock is not None:
+            # The job may have waited for hours, compare with the readings at firing
+            await self.waitUntil(t_ini - CMD_TOUT)
+            self.interlock.rebaseline()
+
+        # Values before the job, once for all rounds
+        previous = dict([(pvname, self.values.get(pvname)) for pvname in pvs])
+
+        report = []
+        for idx, (offset, writes) in enumerate(rounds):
+            t_next = (
+                t_ini + rounds[idx + 1][0]
+                if idx + 1 < len(rounds)
+                else t_ini + offset + EPICS_TOUT
+            )
+            skews = await self.fire(t_ini + offset, writes, pvs, t_next, previous)
+            if not skews:
+                continue
+
+            issues = [issue for issue, _ in skews.values()]
+            logger.info(
+                "round +{:.3f} s: {} devices, issue window {:.3f} ms".format(
+                    offset, len(skews), (max(issues) - min(issues)) * 1e3
+                )
+            )
+            for dev, (issue, done) in sorted(skews.items()):
+                status = "fired +{:.3f} ms, done +{:.3f} ms".format(
+                    issue * 1e3, done * 1e3
+                )
+                logger.info("{} {}".format(dev, status))
+                self.timerStatus.emit({"dev": dev, "status": status})
+            report.append((offset, skews))
+        return report
+
+    def abort(self, tasks, pvname, value, t_update):
+        """ Interlock trip, runs in the event loop """
+        self.tripped = (pvname, value, t_update)
+        for task in tasks:
+            task.cancel()
+        self.tracer.add(
+            "interlock", "interlock", JOB, t_update, time.time(), pv=pvname, value=value
+        )
+        logger.error(
+            "Interlock {} = {}, {} tasks cancelled {:.1f} ms after the CA update".format(
+                pvname, value, len(tasks), (time.time() - t_update) * 1e3
+            )
+        )
+        self.timerStatus.emit({"dev": pvname, "status": "Interlock {}".format(value)})
+
+    async def rollBack(self):
+        """ Restore the previous values, last applied first, devices in parallel """
+        applied, self.applied = self.applied, []
+
+        writes = {}
+        for dev, pvname, val in reversed(applied):
+            if val is None:
+                logger.warning("No previous value of {}, not restored".format(pvname))
+                continue
+            writes.setdefault(dev, []).append((pvname, val))
+
+        async def restore(dev, _writes):
+            self.timerStatus.emit({"dev": dev, "status": "Rollback"})
+            for pvname, val in _writes:
+                await self.put(dev, pvname, val, journal=False)
+                await self.wait(dev, self.pause(dev))
+            self.timerStatus.emit({"dev": dev, "status": "Rolled back"})
+
+        await asyncio.gather(*[restore(dev, _writes) for dev, _writes in writes.items()])
+
+    async def handle(self, mode, step_to_fixed_delay, voltage, devices, when=None):
+        self.tracer = Tracer(enabled=self.traceFile is not None)
+        traceFile = datetime.now().strftime(self.traceFile or "")
+        monitor = None
+        if self.tracer.enabled:
+            monitor = asyncio.ensure_future(self.tracer.monitor())
+
+        try:
+            await self.run(mode, step_to_fixed_delay, voltage, devices, when)
+        finally:
+            if monitor is not None:
+                monitor.cancel()
+            self.tracer.dump(traceFile)
+
+    async def run(self, mode, step_to_fixed_delay, voltage, devices, when):
+        interlockPVs = None
+        if self.interlockFactor is not None:
+            # HTTP request to the devices service, kept out of the event loop
+            interlockPVs = await asyncio.get_event_loop().run_in_executor(
+                None, getInterlockPVs, devices
+            )
+
+        self.tripped, self.applied = None, []
+        tasks = []
+        interlock = None
+        if interlockPVs is not None:
+            pressures, currents = interlockPVs
+            interlock = Watchdog(
+                pressures,
+                currents,
+                self.interlockFactor,
+                self.currentMax,
+                lambda pvname, value, t_update: self.abort(
+                    tasks, pvname, value, t_update
+                ),
+            )
+            interlock.start(asyncio.get_event_loop())
+            try:
+                self.checkInterlock(
+                    pressures, currents, await interlock.ready(EPICS_TOUT)
+                )
+            except Exception:
+                interlock.stop()
+                raise
+        self.interlock = interlock
+
+        if self.tripped is not None:
+            # Tripped while waiting for the readings, nothing is started
+            pass
+        elif when is not None:
+            tasks.append(
+                asyncio.ensure_future(
+                    self.scheduled(when, mode, step_to_fixed_delay, voltage, devices)
+                )
+            )
+        else:
+            tasks += self.createTasks(mode, step_to_fixed_delay, voltage, devices)
+
+        try:
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            if interlock is not None:
+                interlock.stop()
+            self.interlock = None
+
+        if self.tripped is not None:
+            pvname, value, t_update = self.tripped
+            logger.error(
+                "Job aborted by {} = {}, all tasks stopped {:.1f} ms after the CA update".format(
+                    pvname, value, (time.time() - t_update) * 1e3
+                )
+            )
+            if self.rollback:
+                await self.rollBack()
+
+        for result in results:
+            if isinstance(result, Exception) and not isinstance(
+                result, asyncio.CancelledError
+            ):
+                raise result
+
+    def checkInterlock(self, pressures, currents, missing):
+        """ The job is not started unprotected, some pressure and some current must be read """
+        if missing:
+            logger.error(
+                "Interlock without readings of {} PVs: {}".format(
+                    len(missing), ", ".join(missing)
+                )
+            )
+        if not [pvname for pvname in pressures if pvname not in missing]:
+            raise RuntimeError("Interlock without pressure readings, job not started")
+        if not [pvname for pvname in currents if pvname not in missing]:
+            raise RuntimeError("Interlock without current readings, job not started")
 
+    def createTasks(self, mode, step_to_fixed_delay, voltage, devices):
         tasks = []
         for device in devices:
             dev = device["prefix"]
@@ -127,11 +553,10 @@ class AgilentAsync(QObject):
                             self.toStepToFix(step_to_fixed_delay, dev, chs, voltage)
                         )
                     )
-
-        await asyncio.gather(*tasks)
+        return tasks
 
     def asyncStart(
-        self, mode, step_to_fixed_delay, voltage, devices,
+        self, mode, step_to_fixed_delay, voltage, devices, when=None,
     ):
         if sys.version_info >= (3, 7):
             asyncio.run(
@@ -140,6 +565,7 @@ class AgilentAsync(QObject):
                     step_to_fixed_delay=step_to_fixed_delay,
                     voltage=voltage,
                     devices=devices,
+                    when=when,
                 )
             )
         else:
@@ -151,6 +577,7 @@ class AgilentAsync(QObject):
                     step_to_fixed_delay=step_to_fixed_delay,
                     voltage=voltage,
                     devices=devices,
+                    when=when,
                 )
             )
             loop.close()
@@ -158,7 +585,13 @@ class AgilentAsync(QObject):
 
 class AgilentAsyncRunnable(QRunnable):
     def __init__(
-        self, agilentAsync: AgilentAsync, mode, step_to_fixed_delay, voltage, devices,
+        self,
+        agilentAsync: AgilentAsync,
+        mode,
+        step_to_fixed_delay,
+        voltage,
+        devices,
+        when=None,
     ):
         super(AgilentAsyncRunnable, self).__init__()
         self.agilentAsync = agilentAsync
@@ -166,6 +599,7 @@ class AgilentAsyncRunnable(QRunnable):
         self.step_to_fixed_delay = step_to_fixed_delay
         self.voltage = voltage
         self.devices = devices
+        self.when = when
 
     def run(self):
         self.agilentAsync.started.emit()
@@ -175,6 +609,7 @@ class AgilentAsyncRunnable(QRunnable):
                 step_to_fixed_delay=self.step_to_fixed_delay,
                 voltage=self.voltage,
                 devices=self.devices,
+                when=self.when,
             )
         except Exception:
             logger.exception("Unexpected Error")
@@ -215,6 +650,50 @@ if __name__ == "__main__":
         default=600.0,
         dest="step_to_fixed_delay",
     )
+    schedule = parser.add_mutually_exclusive_group()
+    schedule.add_argument(
+        "--at",
+        help='Horário em que o comando é disparado simultaneamente para todos os dispositivos, no formato "dd/mm/aaaa HH:MM:SS".',
+        type=lambda s: datetime.strptime(s, TIMEFMT),
+        default=None,
+    )
+    schedule.add_argument(
+        "--cron",
+        help='Agenda no formato cron "minuto hora dia mês dia_da_semana", ex: "0 8 * * 1". O comando é disparado a cada ocorrência, até que o "--interlock" seja acionado.',
+        type=str,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--interlock",
+        help="Aborta o comando se a pressão de um setor envolvido subir este fator em relação ao início, se a corrente de uma bomba passar de \"--interlock-current\" ou se alguma leitura entrar em alarme MAJOR.",
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "--interlock-current",
+        help='Corrente máxima das bombas em A para o "--interlock".',
+        type=float,
+        default=CURRENT_MAX,
+        dest="interlock_current",
+    )
+    parser.add_argument(
+        "--rollback",
+        help='Requer "--interlock". Ao abortar, restaura os valores anteriores dos dispositivos já configurados.',
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--write",
+        help='Executa as escritas, inclusive nos modos agendados ("--at"/"--cron"). Sem este parâmetro os comandos são apenas registrados no log.',
+        action="store_true",
+    )
+    parser.add_argument(
+        "--trace",
+        help="Arquivo de trace (Chrome/Perfetto) de cada execução. Aceita os campos de data do strftime, ex: trace-%%Y%%m%%d-%%H%%M%%S.json.",
+        type=str,
+        default=None,
+    )
 
     args = parser.parse_args()
 
@@ -223,12 +702,39 @@ if __name__ == "__main__":
     if args.step_to_fixed_delay < 0:
         raise ValueError('Parameter "--step-to-fixed-delay" cannot be less then zero.')
 
+    if args.interlock is not None and args.interlock <= 1:
+        raise ValueError('Parameter "--interlock" must be greater than 1.')
+    if args.rollback and args.interlock is None:
+        raise ValueError('Parameter "--rollback" requires "--interlock".')
+    if args.at is not None and args.at < datetime.now():
+        raise ValueError('Parameter "--at" must be in the future.')
+    if args.cron is not None:
+        nextCronTime(args.cron)
+
     data = getAgilent()
     devices = [device for device in getDevices(data)]
     agilentAsyn = AgilentAsync()
-    agilentAsyn.asyncStart(
-        mode=args.mode,
-        step_to_fixed_delay=args.step_to_fixed_delay,
-        voltage=args.voltage,
-        devices=devices,
-    )
+    agilentAsyn.setWrite(args.write)
+    if args.interlock is not None:
+        agilentAsyn.setInterlock(
+            args.interlock,
+            rollback=args.rollback,
+            current_max=args.interlock_current,
+        )
+    if args.trace is not None:
+        agilentAsyn.setTrace(args.trace)
+
+    while True:
+        agilentAsyn.asyncStart(
+            mode=args.mode,
+            step_to_fixed_delay=args.step_to_fixed_delay,
+            voltage=args.voltage,
+            devices=devices,
+            when=nextCronTime(args.cron) if args.cron else args.at,
+        )
+        if args.cron is None:
+            break
+        if agilentAsyn.tripped is not None:
+            # Do not fire again on a sector that just tripped the interlock
+            logger.error("Schedule stopped by the interlock trip")
+            break
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+import argparse
+import logging
+import time
+import numpy as np
+
+from pvset import PVSet
+from utils import getAgilent, getChannels
+
+logger = logging.getLogger()
+
+# Channel and device readbacks evaluated by the health scan
+CH_PVS = ["HVState-RB", "Voltage-Mon", "VoltageTarget-RB", "Current-Mon"]
+DEV_PVS = ["Step-RB", "Interlock-Mon"]
+
+OK, NO_CONN, OFF, INTERLOCK, VOLTAGE, CURRENT = (
+    "OK",
+    "NO CONN",
+    "OFF",
+    "INTERLOCK",
+    "VOLTAGE",
+    "CURRENT",
+)
+# Most severe first, a channel is reported with the first failing rule
+SEVERITY = [NO_CONN, INTERLOCK, OFF, CURRENT, VOLTAGE, OK]
+
+COLUMNS = ["status", "device", "channel", "voltage", "target", "current", "step"]
+
+
+def stepBit(channel_name):
+    """ Step-RB bit of a channel, C1 is bit 0. Zero for unknown names """
+    try:
+        return 1 << (int(channel_name.upper().lstrip("C")) - 1)
+    except ValueError:
+        logger.warning("Unknown channel name {}".format(channel_name))
+        return 0
+
+
+class HealthScan(object):
+    """ Pre-connected readbacks of every controller/channel pair """
+
+    def __init__(self, channels):
+        # [(device prefix, channel name, channel prefix), ...]
+        self.channels = channels
+        self.devices = list(dict.fromkeys([dev for dev, _, _ in channels]))
+
+        # The same channel may be listed on two controllers, every listing is kept
+        prefixes = [ch for _, _, ch in channels]
+        for prefix in sorted(set([ch for ch in prefixes if prefixes.count(ch) > 1])):
+            logger.warning(
+                "Channel {} listed on {}".format(
+                    prefix, ", ".join([dev for dev, _, ch in channels if ch == prefix])
+                )
+            )
+
+        self.chPVs = PVSet(
+            ["{}:{}".format(ch, pv) for _, _, ch in channels for pv in CH_PVS]
+        )
+        self.devPVs = PVSet(
+            ["{}:{}".format(dev, pv) for dev in self.devices for pv in DEV_PVS]
+        )
+
+        devIdx = dict([(dev, idx) for idx, dev in enumerate(self.devices)])
+        self.chDev = np.array([devIdx[dev] for dev, _, _ in channels], dtype=int)
+        self.chBit = np.array([stepBit(name) for _, name, _ in channels], dtype=int)
+
+    def connect(self):
+        self.chPVs.connect()
+        self.devPVs.connect()
+
+    def read(self):
+        """ One concurrent pass over all readbacks, {column: array} with a row per channel """
+        ch = self.chPVs.get().reshape(len(self.channels), len(CH_PVS))
+        dev = self.devPVs.get().reshape(len(self.devices), len(DEV_PVS))[self.chDev]
+
+        stepMask = np.nan_to_num(dev[:, 0]).astype(int)
+        return {
+            "hv": ch[:, 0],
+            "voltage": ch[:, 1],
+            "target": ch[:, 2],
+            "current": ch[:, 3],
+            "step": np.where(np.isnan(dev[:, 0]), np.nan, (stepMask & self.chBit) != 0),
+            "interlock": dev[:, 1],
+        }
+
+    def evaluate(self, values, voltage_tol, current_min, current_max, target=None):
+        """ Status of every channel, all rules applied over whole arrays """
+        with np.errstate(invalid="ignore"):
+            rules = {
+                NO_CONN: np.isnan(values["hv"])
+                | np.isnan(values["voltage"])
+                | np.isnan(values["current"]),
+                INTERLOCK: np.nan_to_num(values["interlock"]) != 0,
+                OFF: values["hv"] == 0,
+                CURRENT: (values["current"] < current_min)
+                | (values["current"] > current_max),
+                # Voltage follows the pressure in step mode, only fixed mode is checked
+                VOLTAGE: (values["step"] != 1)
+                & (
+                    np.abs(values["voltage"] - values["target"])
+                    > voltage_tol * values["target"]
+                ),
+            }
+            if target is not None:
+                rules[VOLTAGE] |= (values["step"] != 1) & (values["target"] != target)
+
+        status = np.full(len(self.channels), OK, dtype=object)
+        for rule in reversed(SEVERITY[:-1]):
+            status[rules[rule]] = rule
+        return status
+
+    def report(self, values, status, sort="status", only_faults=False):
+        rows = []
+        for idx, (dev, name, ch) in enumerate(self.channels):
+            if only_faults and status[idx] == OK:
+                continue
+            rows.append(
+                {
+                    "status": status[idx],
+                    "device": dev,
+                    "channel": ch,
+                    "voltage": values["voltage"][idx],
+                    "target": values["target"][idx],
+                    "current": values["current"][idx],
+                    "step": values["step"][idx],
+                }
+            )
+
+        if sort == "status":
+            key = lambda row: (SEVERITY.index(row["status"]), row["device"])
+        elif sort in ("voltage", "target", "current", "step"):
+            key = lambda row: -np.nan_to_num(row[sort], nan=-np.inf)
+        else:
+            key = lambda row: row[sort]
+        return sorted(rows, key=key)
+
+
+def formatRow(row):
+    return "{:<10}{:<24}{:<28}{:>10.0f}{:>10.0f}{:>12.3e}{:>6}".format(
+        row["status"],
+        row["device"],
+        row["channel"],
+        row["voltage"],
+        row["target"],
+        row["current"],
+        "-" if np.isnan(row["step"]) else ("yes" if row["step"] else "no"),
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s.%(msecs)03d [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d,%H:%M:%S",
+    )
+    parser = argparse.ArgumentParser(
+        """Verificação de saúde de todos os canais Agilent4UHV
+            Lê todos os canais de uma vez e lista os que estão fora do esperado."""
+    )
+    parser.add_argument(
+        "--sort", choices=COLUMNS, default="status", help="Coluna de ordenação."
+    )
+    parser.add_argument(
+        "--faults", action="store_true", help="Lista somente os canais com falha."
+    )
+    parser.add_argument(
+        "--voltage",
+        help="Tensão alvo esperada para os canais em modo fixo.",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--voltage-tol",
+        help="Desvio relativo máximo entre a tensão lida e a tensão alvo.",
+        type=float,
+        default=0.05,
+        dest="voltage_tol",
+    )
+    parser.add_argument(
+        "--current-min",
+        help="Corrente mínima em A.",
+        type=float,
+        default=0.0,
+        dest="current_min",
+    )
+    parser.add_argument(
+        "--current-max",
+        help="Corrente máxima em A.",
+        type=float,
+        default=1e-4,
+        dest="current_max",
+    )
+    args = parser.parse_args()
+
+    channels = [
+        (dev, name, data["prefix"]) for dev, name, data in getChannels(getAgilent())
+    ]
+
+    t_ini = time.time()
+    scan = HealthScan(channels)
+    scan.connect()
+    t_conn = time.time()
+
+    values = scan.read()
+    status = scan.evaluate(
+        values, args.voltage_tol, args.current_min, args.current_max, args.voltage
+    )
+    t_end = time.time()
+
+    print(
+        "{:<10}{:<24}{:<28}{:>10}{:>10}{:>12}{:>6}".format(
+            "STATUS", "DEVICE", "CHANNEL", "VOLTAGE", "TARGET", "CURRENT", "STEP"
+        )
+    )
+    for row in scan.report(values, status, sort=args.sort, only_faults=args.faults):
+        print(formatRow(row))
+
+    logger.info(
+        "{} channels, {} faults. Connection {:.3f} s, read and evaluation {:.3f} s".format(
+            len(channels),
+            np.count_nonzero(status != OK),
+            t_conn - t_ini,
+            t_end - t_conn,
+        )
+    )
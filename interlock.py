@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+import asyncio
+import epics
+import logging
+import re
+import time
+
+from utils import getMKS, getChannels
+
+logger = logging.getLogger()
+
+# Channel prefixes such as "SI-01C1:VA-SIP20-BG" belong to sector "SI-01"
+SECTOR = re.compile(r"^([A-Z]{2})-(\d{2})")
+MAJOR = 2
+# Sectors per ring, the first and last sectors are neighbours. Transport lines are open
+RINGS = {"BO": 50, "SI": 20}
+# Pumps of a sector without gauges are covered by the nearest gauges up to this distance
+MAX_DISTANCE = 2
+
+
+def getSector(prefix: str):
+    match = SECTOR.match(prefix)
+    return "{}-{}".format(*match.groups()) if match else None
+
+
+def sectorDistance(a: str, b: str):
+    """ Number of sectors between a and b, None if on different accelerators """
+    (area, _a), (_area, _b) = a.split("-"), b.split("-")
+    if area != _area:
+        return None
+    distance = abs(int(_a) - int(_b))
+    if area in RINGS:
+        distance = min(distance, RINGS[area] - distance)
+    return distance
+
+
+def getInterlockPVs(devices):
+    """ (MKS pressures of the devices sectors, pump currents of the devices). A
+    sector without gauges is covered by the gauges of the nearest sectors """
+    currents, sectors = [], {}
+    for device in devices:
+        for ch_name, ch in device["channels"].items():
+            currents.append(ch["prefix"] + ":Current-Mon")
+            sectors.setdefault(getSector(ch["prefix"]), []).append(ch["prefix"])
+
+    gauges = {}
+    for dev, ch_name, ch in getChannels(getMKS()):
+        sector = getSector(ch["prefix"])
+        if sector is not None:
+            gauges.setdefault(sector, []).append(ch["prefix"] + ":Pressure-Mon")
+
+    pressures, neighboured, uncovered = [], [], sectors.pop(None, [])
+    for sector, prefixes in sectors.items():
+        distances = [(sectorDistance(sector, _sector), _sector) for _sector in gauges]
+        distances = [(d, _s) for d, _s in distances if d is not None and d <= MAX_DISTANCE]
+        if not distances:
+            uncovered += prefixes
+            continue
+
+        nearest = min([d for d, _ in distances])
+        for distance, _sector in distances:
+            if distance == nearest:
+                pressures += gauges[_sector]
+        if nearest:
+            neighboured.append(sector)
+
+    if neighboured:
+        logger.info(
+            "Sectors without gauge, covered by the nearest ones: {}".format(
+                ", ".join(sorted(neighboured))
+            )
+        )
+    if uncovered:
+        logger.warning(
+            "No pressure coverage for {} pumps: {}".format(
+                len(uncovered), ", ".join(uncovered)
+            )
+        )
+    return list(dict.fromkeys(pressures)), list(dict.fromkeys(currents))
+
+
+class Watchdog(object):
+    """ Subscribe to the sector pressures and pump currents and call
+    onTrip(pvname, value, t_update) in the event loop the first time a pressure
+    rises factor times over its baseline, a current exceeds current_max or any
+    reading enters MAJOR alarm. Pump currents follow the applied voltage, so a
+    switch to fixed mode raises them by itself, they are only compared with the
+    absolute limit. t_update is the time the CA update arrived. """
+
+    def __init__(self, pressures, currents, factor, current_max, onTrip):
+        self.pressures = set(pressures)
+        self.pvnames = list(pressures) + list(currents)
+        self.factor = factor
+        self.currentMax = current_max
+        self.onTrip = onTrip
+
+        self.loop = None
+        self.pvs = []
+        self.latest = {}
+        self.baseline = {}
+        self.tripped = None
+
+    def start(self, loop):
+        self.loop = loop
+        self.pvs = [epics.PV(pvname, callback=self.update) for pvname in self.pvnames]
+        logger.info("Watchdog subscribed to {} PVs".format(len(self.pvs)))
+
+    def stop(self):
+        for pv in self.pvs:
+            pv.clear_callbacks()
+            pv.disconnect()
+        self.pvs = []
+
+    async def ready(self, timeout):
+        """ Wait until every PV sent its first reading, returns the pvnames still missing """
+        deadline = time.time() + timeout
+        while len(self.baseline) < len(self.pvnames) and time.time() < deadline:
+            await asyncio.sleep(0.005)
+        return [pvname for pvname in self.pvnames if pvname not in self.baseline]
+
+    def rebaseline(self):
+        """ Take the latest readings as reference, e.g. right before a scheduled job fires """
+        self.baseline = dict(self.latest)
+
+    def update(self, pvname=None, value=None, severity=None, **kw):
+        """ CA callback, runs in the CA thread """
+        t_update = time.time()
+        if self.tripped or value is None:
+            return
+
+        self.latest[pvname] = (value, severity)
+        if pvname not in self.baseline:
+            # The first update is the reference, only later changes can trip
+            self.baseline[pvname] = (value, severity)
+            return
+
+        _value, _severity = self.baseline[pvname]
+        if (severity or 0) >= MAJOR and (_severity or 0) < MAJOR:
+            tripped = True
+        elif pvname in self.pressures:
+            tripped = _value > 0 and value > self.factor * _value
+        else:
+            tripped = value > self.currentMax
+
+        if tripped:
+            self.tripped = (pvname, value, t_update)
+            self.loop.call_soon_threadsafe(self.onTrip, pvname, value, t_update)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+import argparse
+import logging
+import os
+import requests
+import sys
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from utils import HTTP_TOUT
+
+logger = logging.getLogger()
+
+ARCHIVER_URL = "https://10.0.38.42/retrieval/data/getData.json"
+ARCHIVER_TIMEFMT = "%Y-%m-%dT%H:%M:%S.000-03:00"
+
+# 1.4826 * MAD estimates the standard deviation of normally distributed data
+MAD_SIGMA = 1.4826
+# Lower bound for the sigma, in decades, so flat baselines still get a margin
+MIN_SIGMA = 0.05
+
+
+def getArchived(pv: str, t_ini: datetime, t_end: datetime, bin_size: int):
+    """ Archived values of pv as a numpy array, binned by the archiver when bin_size > 0 """
+    params = {
+        "pv": "mean_{}({})".format(bin_size, pv) if bin_size > 0 else pv,
+        "from": t_ini.strftime(ARCHIVER_TIMEFMT),
+        "to": t_end.strftime(ARCHIVER_TIMEFMT),
+    }
+    try:
+        res = requests.get(
+            ARCHIVER_URL, params=params, verify=False, timeout=HTTP_TOUT
+        ).json()
+    except Exception:
+        logger.exception("Failed to retrieve {}".format(pv))
+        return np.empty(0)
+
+    if not res:
+        return np.empty(0)
+    data = res[0]["data"]
+    return np.fromiter((d["val"] for d in data), dtype=float, count=len(data))
+
+
+def loadHistory(pvs: list, t_ini: datetime, t_end: datetime, bin_size: int, workers: int):
+    """ Matrix (len(pvs), samples) of log10(pressure), shorter histories padded with NaN """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        series = list(
+            executor.map(lambda pv: getArchived(pv, t_ini, t_end, bin_size), pvs)
+        )
+
+    history = np.full((len(pvs), max([s.size for s in series] + [1])), np.nan)
+    for row, values in zip(history, series):
+        row[: values.size] = values
+
+    # Pressure is log-normal, invalid readings (<= 0) are discarded
+    history[~(history > 0)] = np.nan
+    return np.log10(history)
+
+
+def deriveLimits(history: np.ndarray, high_sigma: float, hihi_decades: float):
+    """ Robust per gauge baseline and proposed limits, every statistic is computed
+    for all gauges at once along the samples axis. """
+    samples = np.count_nonzero(~np.isnan(history), axis=1)
+    valid = samples > 0
+
+    stats = {
+        "samples": samples,
+        "median": np.full(history.shape[0], np.nan),
+        "mad": np.full(history.shape[0], np.nan),
+        "p99": np.full(history.shape[0], np.nan),
+        "p999": np.full(history.shape[0], np.nan),
+    }
+    if valid.any():
+        _history = history[valid]
+        median = np.nanmedian(_history, axis=1)
+        stats["median"][valid] = median
+        stats["mad"][valid] = np.nanmedian(np.abs(_history - median[:, None]), axis=1)
+        stats["p99"][valid], stats["p999"][valid] = np.nanpercentile(
+            _history, [99, 99.9], axis=1
+        )
+
+    sigma = np.maximum(MAD_SIGMA * stats["mad"], MIN_SIGMA)
+    high = np.fmax(stats["median"] + high_sigma * sigma, stats["p999"])
+    stats["HIGH"] = 10 ** high
+    stats["HIHI"] = 10 ** (high + hihi_decades)
+    return stats
+
+
+def writeTable(filename: str, pvs: list, stats: dict):
+    """ Tab separated limit table, one gauge per line """
+    with open(filename, "w") as _f:
+        _f.write("# pv\tHIGH\tHIHI\tmedian\tMAD[dec]\tp99\tsamples\n")
+        for idx, pv in enumerate(pvs):
+            if stats["samples"][idx] == 0:
+                logger.warning("No archived data for {}, skipping.".format(pv))
+                continue
+            _f.write(
+                "{}\t{:.2e}\t{:.2e}\t{:.2e}\t{:.3f}\t{:.2e}\t{}\n".format(
+                    pv,
+                    stats["HIGH"][idx],
+                    stats["HIHI"][idx],
+                    10 ** stats["median"][idx],
+                    stats["mad"][idx],
+                    10 ** stats["p99"][idx],
+                    stats["samples"][idx],
+                )
+            )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s.%(msecs)03d [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d,%H:%M:%S",
+    )
+    parser = argparse.ArgumentParser(
+        """Calcula limites de alarme (HIGH/HIHI) por sensor a partir do histórico do archiver.
+            A tabela gerada é aplicada com "set-pressure-alarms.py --limits"."""
+    )
+    parser.add_argument(
+        "--pv-list",
+        required=True,
+        nargs="+",
+        help="Arquivos com as PVs Pressure-Mon (ex: si-mks-pressure bo-tb-ts-mks-pressure).",
+        dest="pv_list",
+    )
+    parser.add_argument(
+        "--output", required=True, help="Arquivo da tabela de limites.", type=str
+    )
+    parser.add_argument(
+        "--days", help="Dias de histórico utilizados.", type=float, default=14.0
+    )
+    parser.add_argument(
+        "--bin",
+        help="Intervalo em segundos da média calculada pelo archiver (0 para dados brutos).",
+        type=int,
+        default=300,
+        dest="bin_size",
+    )
+    parser.add_argument(
+        "--high-sigma",
+        help="HIGH em número de desvios (MAD) acima da mediana, no mínimo o percentil 99.9.",
+        type=float,
+        default=6.0,
+        dest="high_sigma",
+    )
+    parser.add_argument(
+        "--hihi-decades",
+        help="Décadas entre HIGH e HIHI.",
+        type=float,
+        default=1.0,
+        dest="hihi_decades",
+    )
+    parser.add_argument(
+        "--workers",
+        help="Requisições simultâneas ao archiver.",
+        type=int,
+        default=16,
+    )
+    args = parser.parse_args()
+
+    pvs = []
+    for pv_list in args.pv_list:
+        with open(pv_list) as _f:
+            pvs += [p.strip() for p in _f.readlines() if p.strip()]
+    # Keep the first occurrence order
+    pvs = list(dict.fromkeys(pvs))
+
+    t_end = datetime.now()
+    t_ini = t_end - timedelta(days=args.days)
+
+    history = loadHistory(pvs, t_ini, t_end, args.bin_size, args.workers)
+    logger.info("Loaded {} samples of {} gauges".format(history.size, len(pvs)))
+
+    stats = deriveLimits(history, args.high_sigma, args.hihi_decades)
+    writeTable(args.output, pvs, stats)
+    logger.info("Limit table written to {}".format(args.output))
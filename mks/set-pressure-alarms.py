@@ -1,19 +1,62 @@
 #!/usr/bin/env python3
 import argparse
-from epics import caput
+import logging
+import os
+import sys
+import time
+from epics import PV, ca
 
-# bo-tb-ts-mks-pressure  si-mks-pressure
-with open('bo-tb-ts-mks-pressure') as _f:
-    pvs = [p.replace('\n','') for p in _f.readlines()]
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils import EPICS_TOUT
 
-for pv in pvs:
-    caput('{}.HIGH'.format(pv), 1e-8, timeout=1)
-    caput('{}.HIHI'.format(pv), 1e-7, timeout=1)
+logger = logging.getLogger()
 
 
-with open('si-mks-pressure') as _f:
-    pvs = [p.replace('\n','') for p in _f.readlines()]
+def setLimits(limits):
+    """ Put all (pv, HIGH, HIHI) at once and wait for every completion """
+    puts = []
+    for pv, high, hihi in limits:
+        puts.append((PV('{}.HIGH'.format(pv), auto_monitor=False), high))
+        puts.append((PV('{}.HIHI'.format(pv), auto_monitor=False), hihi))
 
-for pv in pvs:
-    caput('{}.HIGH'.format(pv), 1e-9, timeout=1)
-    caput('{}.HIHI'.format(pv), 1e-8, timeout=1)
+    deadline = time.time() + EPICS_TOUT
+    for _pv, val in puts:
+        if _pv.wait_for_connection(timeout=max(deadline - time.time(), 0.001)):
+            _pv.put(val, wait=False, use_complete=True)
+        else:
+            logger.warning('{} not connected'.format(_pv.pvname))
+    ca.flush_io()
+
+    deadline = time.time() + EPICS_TOUT
+    pending = [_pv for _pv, _ in puts if _pv.connected]
+    while pending and time.time() < deadline:
+        time.sleep(0.01)
+        pending = [_pv for _pv in pending if not _pv.put_complete]
+    for _pv in pending:
+        logger.warning('{} put not completed'.format(_pv.pvname))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s.%(msecs)03d [%(levelname)s] %(message)s',
+                        datefmt='%Y-%m-%d,%H:%M:%S')
+    parser = argparse.ArgumentParser('Configura os limites de alarme HIGH/HIHI dos sensores de pressão.')
+    parser.add_argument('--limits', help='Tabela de limites gerada por derive-pressure-alarms.py. Sem ela são usados os limites fixos por acelerador.', type=str, default=None)
+    args = parser.parse_args()
+
+    limits = []
+    if args.limits:
+        with open(args.limits) as _f:
+            for line in _f.readlines():
+                if not line.strip() or line.startswith('#'):
+                    continue
+                pv, high, hihi = line.split('\t')[:3]
+                limits.append((pv, float(high), float(hihi)))
+    else:
+        # bo-tb-ts-mks-pressure  si-mks-pressure
+        with open('bo-tb-ts-mks-pressure') as _f:
+            limits += [(p.replace('\n',''), 1e-8, 1e-7) for p in _f.readlines()]
+
+        with open('si-mks-pressure') as _f:
+            limits += [(p.replace('\n',''), 1e-9, 1e-8) for p in _f.readlines()]
+
+    setLimits(limits)
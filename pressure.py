@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+import argparse
+import epics
+import logging
+import re
+import time
+import numpy as np
+
+from utils import getAgilent, getChannels
+
+logger = logging.getLogger()
+
+# Pump model from the channel prefix, e.g. "SI-01C1:VA-SIP20-BG" is a SIP20
+MODEL = re.compile(r":VA-(SIP\d+)-")
+
+# Voltages where the calibration sensitivities are given
+VOLTAGES = np.array([3000.0, 5000.0, 7000.0])
+
+
+def loadCalibration(filename):
+    """ Measured calibration per pump model: sensitivity K [A/mbar] at each of
+    VOLTAGES, exponent n and leakage current [A] of I = K * P**n + leakage.
+    Tab separated "model  K@3000  K@5000  K@7000  n  leakage" lines """
+    calibration = {}
+    with open(filename) as _f:
+        for line in _f.readlines():
+            if not line.strip() or line.startswith("#"):
+                continue
+            fields = line.split()
+            model, values = fields[0], [float(v) for v in fields[1:]]
+            if len(values) != len(VOLTAGES) + 2:
+                raise ValueError("Invalid calibration line {}".format(line))
+            calibration[model] = (values[: len(VOLTAGES)], values[-2], values[-1])
+    return calibration
+
+
+def getModel(prefix):
+    match = MODEL.search(prefix)
+    return match.group(1) if match else None
+
+
+class PressureEstimator(object):
+    """ Pressure of every pump channel estimated from its current and voltage.
+    Readings arrive through CA monitors into preallocated arrays and each update
+    converts all channels at once, so the cost per update is a few array passes
+    whatever the channel count. """
+
+    def __init__(self, prefixes, calibration):
+        # A channel listed on two controllers is estimated once
+        self.prefixes = list(dict.fromkeys(prefixes))
+        size = len(self.prefixes)
+
+        models = list(calibration.keys())
+        modelIdx = dict([(model, idx) for idx, model in enumerate(models)])
+        # The last row, all NaN, is used by the channels of unknown model
+        sensitivity = np.array(
+            [calibration[m][0] for m in models] + [[np.nan] * len(VOLTAGES)]
+        )
+        exponent = np.array([calibration[m][1] for m in models] + [np.nan])
+        leakage = np.array([calibration[m][2] for m in models] + [np.nan])
+
+        chModel = np.array(
+            [modelIdx.get(getModel(prefix), len(models)) for prefix in self.prefixes],
+            dtype=int,
+        )
+        unknown = np.count_nonzero(chModel == len(models))
+        if unknown:
+            logger.warning("{} channels of unknown pump model".format(unknown))
+
+        # Per channel constants
+        self.sensitivity = sensitivity[chModel]
+        self.invExponent = 1 / exponent[chModel]
+        self.leakage = leakage[chModel]
+        self.rows = np.arange(size)
+
+        self.current = np.full(size, np.nan)
+        self.voltage = np.full(size, np.nan)
+        self.pressure = np.full(size, np.nan)
+
+        self.index = {}
+        self.pvs = []
+
+    def subscribe(self):
+        for idx, prefix in enumerate(self.prefixes):
+            for suffix in ("Current-Mon", "Voltage-Mon"):
+                pvname = "{}:{}".format(prefix, suffix)
+                self.index[pvname] = idx
+                self.pvs.append(
+                    epics.PV(
+                        pvname,
+                        callback=self.onUpdate,
+                        connection_callback=self.onConnection,
+                    )
+                )
+        logger.info("Subscribed to {} PVs".format(len(self.pvs)))
+
+    def onUpdate(self, pvname=None, value=None, **kw):
+        """ CA callback, only stores the reading """
+        if value is None:
+            return
+        idx = self.index[pvname]
+        if pvname.endswith("Current-Mon"):
+            self.current[idx] = value
+        else:
+            self.voltage[idx] = value
+
+    def onConnection(self, pvname=None, conn=None, **kw):
+        """ CA callback, a disconnected reading is not used any more """
+        if conn:
+            return
+        idx = self.index[pvname]
+        if pvname.endswith("Current-Mon"):
+            self.current[idx] = np.nan
+        else:
+            self.voltage[idx] = np.nan
+
+    def update(self):
+        """ Pressure [mbar] of all channels from the latest readings """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            voltage = np.clip(self.voltage, VOLTAGES[0], VOLTAGES[-1])
+            high = np.clip(np.searchsorted(VOLTAGES, voltage), 1, len(VOLTAGES) - 1)
+            low = high - 1
+            weight = (voltage - VOLTAGES[low]) / (VOLTAGES[high] - VOLTAGES[low])
+
+            k = self.sensitivity[self.rows, low] * (1 - weight)
+            k += self.sensitivity[self.rows, high] * weight
+
+            current = np.maximum(self.current - self.leakage, 0)
+            np.power(current / k, self.invExponent, out=self.pressure)
+            # HV off, the current does not relate to the pressure
+            self.pressure[~(self.voltage > 0)] = np.nan
+        return self.pressure
+
+    def stream(self, rate, publish):
+        """ Update and publish at a fixed rate, a late cycle does not accumulate delay """
+        period = 1 / rate
+        t_next = time.time()
+        while True:
+            t_ini = time.time()
+            publish(self.update())
+            elapsed = time.time() - t_ini
+            if elapsed > period:
+                logger.warning(
+                    "Update took {:.3f} s, longer than the period {:.3f} s".format(
+                        elapsed, period
+                    )
+                )
+
+            now = time.time()
+            t_next = max(t_next + period, now)
+            time.sleep(t_next - now)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s.%(msecs)03d [%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%d,%H:%M:%S",
+    )
+    parser = argparse.ArgumentParser(
+        """Estimativa de pressão a partir da corrente das bombas iônicas
+            Converte corrente e tensão de todos os canais em pressão conforme o modelo da bomba."""
+    )
+    parser.add_argument(
+        "--rate", help="Taxa de publicação em Hz.", type=float, default=1.0
+    )
+    parser.add_argument(
+        "--calibration",
+        help="Tabela de calibração medida por modelo (modelo, K a 3000/5000/7000 V, n, corrente de fuga).",
+        type=str,
+        required=True,
+    )
+    parser.add_argument(
+        "--output-pv",
+        help="PV waveform onde as pressões estimadas são publicadas, na ordem dos canais.",
+        type=str,
+        default=None,
+        dest="output_pv",
+    )
+    args = parser.parse_args()
+
+    if args.rate <= 0:
+        raise ValueError('Parameter "--rate" must be greater than zero.')
+
+    calibration = loadCalibration(args.calibration)
+
+    prefixes = [ch["prefix"] for _, _, ch in getChannels(getAgilent())]
+    estimator = PressureEstimator(prefixes, calibration)
+    estimator.subscribe()
+
+    output = None
+    if args.output_pv is not None:
+        output = epics.PV(args.output_pv, auto_monitor=False)
+
+    def publish(pressure):
+        if output is not None and output.connected:
+            output.put(pressure, wait=False)
+
+        valid = ~np.isnan(pressure)
+        if valid.any():
+            idx = np.nanargmax(pressure)
+            logger.info(
+                "{} of {} channels estimated, max {:.2e} mbar at {}".format(
+                    np.count_nonzero(valid),
+                    len(pressure),
+                    pressure[idx],
+                    estimator.prefixes[idx],
+                )
+            )
+        else:
+            logger.info("No channel estimated")
+
+    estimator.stream(args.rate, publish)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+import epics
+import logging
+import time
+import numpy as np
+
+from utils import EPICS_TOUT
+
+logger = logging.getLogger()
+
+
+class PVSet(object):
+    """ PVs created and connected at once, then read in bulk as numpy arrays """
+
+    def __init__(self, pvnames, timeout=EPICS_TOUT):
+        # A PV is created once per name, values are returned aligned with pvnames
+        # even when a name is repeated
+        self.pvnames = list(pvnames)
+        unique = list(dict.fromkeys(self.pvnames))
+        uniqueIdx = dict([(pvname, idx) for idx, pvname in enumerate(unique)])
+        self.index = np.array([uniqueIdx[pvname] for pvname in self.pvnames], dtype=int)
+        self.timeout = timeout
+        self.pvs = [epics.PV(pvname, auto_monitor=False) for pvname in unique]
+
+    def connect(self):
+        """ Wait for every connection within a single timeout, returns the connected mask """
+        deadline = time.time() + self.timeout
+        for pv in self.pvs:
+            if not pv.connected:
+                pv.wait_for_connection(timeout=max(deadline - time.time(), 0.001))
+
+        connected = self.connected()
+        if not connected.all():
+            logger.warning(
+                "{} of {} PVs not connected".format(
+                    np.count_nonzero(~connected), len(connected)
+                )
+            )
+        return connected
+
+    def connected(self):
+        """ Connected mask aligned with pvnames """
+        return np.fromiter(
+            (pv.connected for pv in self.pvs), dtype=bool, count=len(self.pvs)
+        )[self.index]
+
+    def get(self):
+        """ Read all connected PVs concurrently, NaN for the ones not available """
+        pending = [(idx, pv) for idx, pv in enumerate(self.pvs) if pv.connected]
+        for idx, pv in pending:
+            epics.ca.get(pv.chid, wait=False)
+        epics.ca.flush_io()
+
+        values = np.full(len(self.pvs), np.nan)
+        deadline = time.time() + self.timeout
+        for idx, pv in pending:
+            value = epics.ca.get_complete(
+                pv.chid, timeout=max(deadline - time.time(), 0.001)
+            )
+            if value is not None:
+                values[idx] = value
+        return values[self.index]
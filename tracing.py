@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+import asyncio
+import json
+import logging
+import time
+
+from contextlib import contextmanager
+
+logger = logging.getLogger()
+
+UNKNOWN_HOST = "unknown"
+# Event loop wakeups are recorded only when late by more than LAG_TOUT seconds
+LAG_TOUT = 0.002
+# Spans beyond MAX_SPANS are counted and dropped
+MAX_SPANS = 100000
+# Track of the spans not bound to a device
+JOB = "job"
+
+
+class Tracer(object):
+    """ Spans buffered in memory and written at the end of the job as Chrome
+    trace-event JSON (chrome://tracing, ui.perfetto.dev). Every host IP is a
+    process and every device a thread of its host. """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        # (name, category, device, start, end, args)
+        self.spans = []
+        self.dropped = 0
+        self.hosts = {}
+
+        # Spans in progress that are not idle, the monitor only runs while any
+        self.busy = 0
+        self.active = None
+
+    def setHost(self, dev, host):
+        """ Host of the device, "ip:port" as in epics.PV.host """
+        if host and dev not in self.hosts:
+            self.hosts[dev] = host.split(":")[0]
+
+    def add(self, name, cat, dev, start, end, **args):
+        """ Span from the wall-clock timestamps start to end """
+        if not self.enabled:
+            return
+        if len(self.spans) >= MAX_SPANS:
+            self.dropped += 1
+            return
+        self.spans.append((name, cat, dev, start, end, args))
+
+    def setBusy(self, delta):
+        self.busy += delta
+        if self.active is not None:
+            if self.busy > 0:
+                self.active.set()
+            else:
+                self.active.clear()
+
+    @contextmanager
+    def span(self, name, cat, dev=JOB, idle=False, **args):
+        """ Span around the block, idle spans (long sleeps) do not run the monitor """
+        if not self.enabled:
+            yield
+            return
+        if not idle:
+            self.setBusy(1)
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, cat, dev, start, time.time(), **args)
+            if not idle:
+                self.setBusy(-1)
+
+    async def monitor(self, interval=0.010):
+        """ Record the late event loop wakeups while puts and waits are in flight,
+        the span length is the wakeup lag """
+        self.active = asyncio.Event()
+        self.setBusy(0)
+        while True:
+            await self.active.wait()
+            expected = time.time() + interval
+            await asyncio.sleep(interval)
+            if time.time() - expected > LAG_TOUT:
+                self.add("wakeup", "scheduler", JOB, expected, time.time())
+
+    def events(self):
+        pids, tids, events = {}, {}, []
+
+        def track(dev):
+            host = self.hosts.get(dev, UNKNOWN_HOST if dev != JOB else JOB)
+            if host not in pids:
+                pids[host] = len(pids) + 1
+                events.append(
+                    {
+                        "name": "process_name",
+                        "ph": "M",
+                        "pid": pids[host],
+                        "args": {"name": host},
+                    }
+                )
+            if (host, dev) not in tids:
+                tids[(host, dev)] = len(tids) + 1
+                events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": pids[host],
+                        "tid": tids[(host, dev)],
+                        "args": {"name": dev},
+                    }
+                )
+            return pids[host], tids[(host, dev)]
+
+        t_ini = min([start for _, _, _, start, _, _ in self.spans], default=0)
+        for name, cat, dev, start, end, args in self.spans:
+            pid, tid = track(dev)
+            events.append(
+                {
+                    "name": name,
+                    "cat": cat,
+                    "ph": "X",
+                    "ts": (start - t_ini) * 1e6,
+                    "dur": max(end - start, 0) * 1e6,
+                    "pid": pid,
+                    "tid": tid,
+                    "args": args,
+                }
+            )
+        return events
+
+    def dump(self, filename):
+        if not self.enabled:
+            return
+        with open(filename, "w") as _f:
+            json.dump({"traceEvents": self.events(), "displayTimeUnit": "ms"}, _f)
+        logger.info("Trace with {} spans written to {}".format(len(self.spans), filename))
+        if self.dropped:
+            logger.warning("{} spans over {} dropped".format(self.dropped, MAX_SPANS))
+        self.spans = []
+        self.dropped = 0
@@ -1,57 +1,142 @@
 #!/usr/bin/env python3
+import asyncio
 import epics
+import os
 import re
+import sys
 import time
 import argparse
 import logging
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from adaptive import AdaptiveWriter
+from utils import EPICS_TOUT
+
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s.%(msecs)03d [%(levelname)s] %(message)s',
                                 datefmt='%Y-%m-%d,%H:%M:%S')
 logger = logging.getLogger()
 
-epics_tout = 1
-cmd_tout = 0.500
-
 FIXED, STEP = 'fixed', 'step'
 
+# Controller "SR-RA01:VA-SIPC-03", channel "SI-01SA:VA-SIP20-BG" or unnamed "SR-RA01:VA-SIPC-03:C4"
+CONTROLLER = re.compile(r'^[A-Z]{2}-RA\d{2}:VA-SIPC-\d{2}$')
+CHANNEL = re.compile(r'^[A-Z]{2}-[A-Z0-9]+:VA-SIP\d+-[A-Z0-9]+$')
+UNNAMED_CHANNEL = re.compile(r'^C[1-4]$')
+
+
+def validChannel(dev, ch):
+    if CHANNEL.match(ch):
+        return True
+    return ch.startswith(dev + ':') and UNNAMED_CHANNEL.match(ch[len(dev) + 1:]) is not None
+
+
+def loadPlan(device_lists):
+    """ {controller: [channel, ...]} of all lists, each channel listed once.
+    Raises ValueError listing every invalid name. """
+    plan, owner, errors = {}, {}, []
+    for device_list in device_lists:
+        with open(device_list) as _f:
+            for lineno, line in enumerate(_f.readlines(), 1):
+                pvs = re.sub(r'\s+', ' ', line).strip().split(' ')
+                dev, chs = pvs[0], pvs[1:]
+                if not dev:
+                    continue
+                if not CONTROLLER.match(dev):
+                    errors.append('{}:{} invalid controller "{}"'.format(device_list, lineno, dev))
+                    continue
+
+                plan.setdefault(dev, [])
+                for ch in chs:
+                    if not validChannel(dev, ch):
+                        errors.append('{}:{} invalid channel "{}"'.format(device_list, lineno, ch))
+                    elif ch in owner:
+                        if owner[ch] != dev:
+                            logger.warning('{} listed on {} and {}, set through {} only.'.format(ch, owner[ch], dev, owner[ch]))
+                    else:
+                        owner[ch] = dev
+                        plan[dev].append(ch)
+    if errors:
+        raise ValueError('Invalid device list:\n' + '\n'.join(errors))
+    return plan
+
+
+def getWrites(plan, mode, voltage):
+    """ {controller: [(pv, value), ...]} in the order they must be applied """
+    writes = {}
+    for dev, chs in plan.items():
+        if mode == FIXED:
+            writes[dev] = [(dev + ':Step-SP_Backend', 0)] + [(ch + ':VoltageTarget-SP', voltage) for ch in chs]
+        elif mode == STEP:
+            writes[dev] = [(dev + ':Step-SP_Backend', 15)]
+    return writes
+
+
+class Progress(object):
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.t_ini = time.time()
+
+    def line(self):
+        elapsed = time.time() - self.t_ini
+        eta = elapsed / self.done * (self.total - self.done) if self.done else float('nan')
+        return '[{}/{}] {} failed, elapsed {:.1f} s, ETA {:.1f} s'.format(self.done, self.total, self.failed, elapsed, eta)
+
+    async def show(self, interval=0.5):
+        end = '\r' if sys.stdout.isatty() else '\n'
+        while True:
+            print(self.line(), end=end, flush=True)
+            await asyncio.sleep(interval)
+
+
+async def run(writes, concurrency):
+    writer = AdaptiveWriter()
+    progress = Progress(sum([len(w) for w in writes.values()]))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    # Create every PV up front so all connections are searched in parallel
+    pvs = dict([(pv, epics.PV(pv, auto_monitor=False)) for w in writes.values() for pv, _ in w])
+    deadline = time.time() + EPICS_TOUT
+    while not all([pv.connected for pv in pvs.values()]) and time.time() < deadline:
+        await asyncio.sleep(0.01)
+    for pvname, pv in pvs.items():
+        if not pv.connected:
+            logger.warning('PV {} not connected'.format(pvname))
+
+    async def apply(dev, _writes):
+        """ Writes of a controller, in order and paced to its host """
+        async with semaphore:
+            for pvname, val in _writes:
+                pv = pvs[pvname]
+                logger.info('set {} {}'.format(pvname, val))
+                if not await writer.put(pv, val):
+                    progress.failed += 1
+                progress.done += 1
+                await asyncio.sleep(writer.pause(pv.host))
+
+    monitor = asyncio.ensure_future(progress.show())
+    try:
+        await asyncio.gather(*[apply(dev, _writes) for dev, _writes in writes.items()])
+    finally:
+        monitor.cancel()
+        print(progress.line())
+    return progress.failed
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser("""Utilitário para Agilent4UHV
             Configura tensão dos canais e o modo de operação do dispositivo.""")
 
-    parser.add_argument('--device-list', required=True, help="Lista com os dispositivos/canais.", type=str)
+    parser.add_argument('--device-list', required=True, nargs='+', help="Listas com os dispositivos/canais. Canais repetidos são configurados uma única vez.", type=str)
     parser.add_argument('--voltage', choices=[3000,5000,7000], required=True, help="Tensão dos canais em modo fixo. Ajustado somente se o modo de operação for 'fixed'.", type=float)
     parser.add_argument('--mode', choices=[FIXED, STEP], required=True, help="Modo de operação do dispositivo (fixed/step).", type=str)
+    parser.add_argument('--concurrency', help="Número máximo de controladores configurados simultaneamente.", type=int, default=64)
     args = parser.parse_args()
 
-    voltage = args.voltage
-    mode = args.mode
-    device_list = args.device_list
-
-    devices = []
-    with open(device_list) as _f:
-        devices = _f.readlines()
-
-    for device in devices:
-        pvs = re.sub('\s+', ' ', device).strip().replace('\n','').split(' ')
-        dev = pvs[0]
-        chs = pvs[1:]
-        
-        if mode == FIXED:
-            pv, val = dev + ':Step-SP_Backend', 0
-            logger.info('set {} {}'.format(pv, val))
-            epics.caput(pv, val, timeout=epics_tout)
-            time.sleep(cmd_tout)
-
-            for ch in chs:
-                pv, val = ch + ':VoltageTarget-SP', voltage
-                logger.info('set {} {}'.format(pv, val))
-                epics.caput(pv, val, timeout=epics_tout)
-                time.sleep(cmd_tout)
-
-        elif mode == STEP:
-            pv, val = dev + ':Step-SP_Backend', 15
-            logger.info('set {} {}'.format(pv, val))
-            epics.caput(pv, val, timeout=epics_tout)
-            time.sleep(cmd_tout)
+    plan = loadPlan(args.device_list)
+    writes = getWrites(plan, args.mode, args.voltage)
+    logger.info('{} controllers, {} channels, {} writes'.format(len(plan), sum([len(chs) for chs in plan.values()]), sum([len(w) for w in writes.values()])))
 
+    failed = asyncio.run(run(writes, args.concurrency))
+    sys.exit(1 if failed else 0)
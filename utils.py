@@ -2,18 +2,29 @@
 import requests
 import logging
 
+from datetime import datetime, timedelta
+
 logger = logging.getLogger()
 TIMEFMT = "%d/%m/%Y %H:%M:%S"
 
 DEVICES_URL = "http://10.0.38.42:26001/devices"
+HTTP_TOUT = 10
+
+# CA connection/put timeout and pause between commands to the same controller
+EPICS_TOUT = 1
+CMD_TOUT = 0.500
 
 
 def getMKS():
-    return requests.get(DEVICES_URL, verify=False, params={"type": "mks"}).json()
+    return requests.get(
+        DEVICES_URL, verify=False, params={"type": "mks"}, timeout=HTTP_TOUT
+    ).json()
 
 
 def getAgilent():
-    return requests.get(DEVICES_URL, verify=False, params={"type": "agilent"}).json()
+    return requests.get(
+        DEVICES_URL, verify=False, params={"type": "agilent"}, timeout=HTTP_TOUT
+    ).json()
 
 
 def getDevices(data: dict):
@@ -31,6 +42,66 @@ def getChannels(data: dict):
                 yield device["prefix"], channel_name, channel_data
 
 
+def _cronField(field: str, lo: int, hi: int):
+    """ Set of values matched by a cron field ("*", "a", "a-b", "*/n", "a-b/n", comma separated) """
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, _step = part.split("/")
+            step = int(_step)
+
+        if part == "*":
+            start, end = lo, hi
+        elif "-" in part:
+            start, end = [int(v) for v in part.split("-")]
+        else:
+            start = int(part)
+            end = hi if step != 1 else start
+
+        if start < lo or end > hi or start > end or step < 1:
+            raise ValueError('Invalid cron field "{}"'.format(field))
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def nextCronTime(expr: str, after: datetime = None):
+    """ First datetime after "after" (default now) matching the cron expression
+    "minute hour day-of-month month day-of-week" (day-of-week 0 or 7 is Sunday) """
+    fields = expr.split()
+    if len(fields) != 5:
+        raise ValueError('Invalid cron expression "{}"'.format(expr))
+
+    minutes = _cronField(fields[0], 0, 59)
+    hours = _cronField(fields[1], 0, 23)
+    days = _cronField(fields[2], 1, 31)
+    months = _cronField(fields[3], 1, 12)
+    weekdays = set([d % 7 for d in _cronField(fields[4], 0, 7)])
+
+    def dayMatch(t):
+        dom, dow = t.day in days, (t.weekday() + 1) % 7 in weekdays
+        # As in cron, when both day fields are restricted either one may match
+        if fields[2] != "*" and fields[4] != "*":
+            return dom or dow
+        return dom and dow
+
+    t = (after or datetime.now()).replace(second=0, microsecond=0)
+    t += timedelta(minutes=1)
+    limit = t + timedelta(days=366 * 5)
+    while t < limit:
+        if t.month not in months:
+            t = (t.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+        elif not dayMatch(t):
+            t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+        elif t.hour not in hours:
+            t = (t + timedelta(hours=1)).replace(minute=0)
+        elif t.minute not in minutes:
+            t += timedelta(minutes=1)
+        else:
+            return t
+    raise ValueError('Cron expression "{}" never matches'.format(expr))
+
+
 if __name__ == "__main__":
     # for ip, dev in getAgilent().items():
     data = getAgilent()